@@ -6,62 +6,150 @@ and sends messages to a specified Google Chat channel. The application also incl
 """
 
 from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
 import httpx
 from loguru import logger
+import orjson
 import sentry_sdk
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import functools
+import sys
+from time import monotonic
+from typing import Any, AsyncIterator, Callable, Coroutine, List, Optional
+from urllib.parse import urlencode
 
-from os import getenv
-from typing import Any, Dict, Optional
+from app.settings import get_settings
+from app.transform import (
+    SentryPayload,
+    transform_sentry_webhook_to_google_chat,
+)
 
-BITRIX24_WEBHOOK_URL = getenv("BITRIX24_WEBHOOK_URL")
-BITRIX24_DIALOG_ID = getenv("BITRIX24_DIALOG_ID")
-SENTRY_DSN = getenv("SENTRY_DSN")
-ALLOWED_ENVIRONMENTS = getenv("ALLOWED_ENVIRONMENTS", "production,prod").split(",")
+QUEUE_MAXSIZE = 1000
+WORKER_COUNT = 8
+BATCH_MAX = 50
+SEEN_MAXSIZE = 10_000
+BREAKER_FAIL_MAX = 5
+BREAKER_RESET_TIMEOUT = 30.0
 
-if not BITRIX24_WEBHOOK_URL or not SENTRY_DSN:
-    raise ValueError(
-        "Please make sure that BITRIX24_WEBHOOK_URL and SENTRY_DSN are specified in the service.env file."
-    )
+# LRU set of recently handled Sentry webhook ids; asyncio is
+# single-threaded, so no locking is needed around it.
+_seen: "OrderedDict[str, None]" = OrderedDict()
 
+# Writes go through a background thread queue so logging never blocks
+# the event loop.
+logger.remove()
+logger.add(sys.stderr, level=get_settings().log_level, enqueue=True)
 
+
+@functools.cache
 def init_sentry() -> None:
-    """Initialize Sentry SDK for error tracking."""
-    if not hasattr(init_sentry, "_called"):
-        sentry_sdk.init(
-            dsn=SENTRY_DSN,
-            traces_sample_rate=1.0,
-            profiles_sample_rate=1.0,
-        )
-        init_sentry._called = True
+    """Initialize Sentry SDK for error tracking. Runs at most once."""
+    sentry_sdk.init(
+        dsn=get_settings().sentry_dsn,
+        traces_sample_rate=0.05,
+        profiles_sample_rate=0.05,
+    )
 
 
 init_sentry()
 
-app = FastAPI()
-
-
-def transform_sentry_webhook_to_google_chat(
-        sentry_payload: Dict[str, Any],
-) -> Optional[Dict[str, str]]:
-    """Transform Sentry webhook payload into a format suitable for Bitrix24."""
-    event = sentry_payload.get("event", {})
-    environment = event.get("environment", "").lower().strip()
-    if environment not in ALLOWED_ENVIRONMENTS:
-        return None
-
-    return {
-        "DIALOG_ID": BITRIX24_DIALOG_ID,
-        "MESSAGE": (
-            f"*ID*: {sentry_payload.get('id')}\n"
-            f"*Project*: {sentry_payload.get('project_name')}\n"
-            f"*Environment*: {event.get('environment')}\n"
-            f"*Level*: {sentry_payload.get('level')}\n"
-            f"*Culprit*: {sentry_payload.get('culprit')}\n"
-            f"*Message*: {sentry_payload.get('message')}\n"
-            f"*Platform*: {event.get('platform', 'unknown')}\n"
-            f"*URL*: {sentry_payload.get('url')}"
-        )
-    }
+
+class CircuitBreaker:
+    """Failure-counting circuit breaker around Bitrix24 delivery.
+
+    Opens after ``fail_max`` consecutive failures and fast-fails sends
+    until ``reset_timeout`` seconds have passed, then lets the next send
+    through as a trial.
+    """
+
+    def __init__(
+            self,
+            fail_max: int = BREAKER_FAIL_MAX,
+            reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ) -> None:
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        if self._opened_at is None:
+            return False
+        if monotonic() - self._opened_at >= self.reset_timeout:
+            self._opened_at = None
+            return False
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._failures >= self.fail_max:
+            self._opened_at = monotonic()
+
+
+class ORJSONRequest(Request):
+    """Request that decodes JSON bodies with orjson instead of stdlib json."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """Route that hands ORJSONRequest instances to endpoint handlers."""
+
+    def get_route_handler(
+            self,
+    ) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        original_route_handler = super().get_route_handler()
+
+        async def orjson_route_handler(request: Request) -> Response:
+            return await original_route_handler(
+                ORJSONRequest(request.scope, request.receive)
+            )
+
+        return orjson_route_handler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Manage a shared Bitrix24 HTTP client for the application lifetime."""
+    app.state.http = httpx.AsyncClient(
+        base_url=get_settings().bitrix24_webhook_url,
+        headers={"Content-Type": "application/json; charset=UTF-8"},
+        timeout=httpx.Timeout(connect=1.0, read=3.0, write=1.0, pool=1.0),
+        http2=True,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+    )
+    app.state.breaker = CircuitBreaker()
+    app.state.queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    app.state.workers = [
+        asyncio.create_task(_worker(app)) for _ in range(WORKER_COUNT)
+    ]
+    yield
+    for worker in app.state.workers:
+        worker.cancel()
+    await asyncio.gather(*app.state.workers, return_exceptions=True)
+    await app.state.http.aclose()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.router.route_class = ORJSONRoute
 
 
 @app.head(
@@ -79,31 +167,123 @@ def health_check() -> Response:
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@app.post("/sentry-webhook")
-async def receive_sentry_webhook(request: Request):
-    """Process a Sentry webhook."""
-    data = await request.json()
+def _build_batch_body(messages: List[bytes]) -> bytes:
+    """Bundle serialized messages into one Bitrix24 `batch` request body."""
+    cmd = {
+        f"n{index}": "im.message.add?" + urlencode(orjson.loads(raw))
+        for index, raw in enumerate(messages)
+    }
+    return orjson.dumps({"halt": 0, "cmd": cmd})
 
-    bitrix_message = transform_sentry_webhook_to_google_chat(data)
-    if not bitrix_message:
-        return {"message": "Environment not allowed. Skipping notification."}
 
+def _batch_errors(response: httpx.Response) -> Any:
+    """Extract per-command errors from a Bitrix24 `batch` response.
+
+    The batch method answers 200 even when sub-commands fail and reports
+    those failures in ``result.result_error``.
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                BITRIX24_WEBHOOK_URL,
-                json=bitrix_message,
-                headers={"Content-Type": "application/json; charset=UTF-8"},
-            )
+        result = orjson.loads(response.content).get("result", {})
+    except orjson.JSONDecodeError:
+        return "unparseable batch response"
+    return result.get("result_error") or None
+
+
+async def _deliver(
+        http: httpx.AsyncClient,
+        breaker: CircuitBreaker,
+        bitrix_message: bytes,
+        url: str = "",
+        is_batch: bool = False,
+) -> None:
+    """Send a prepared message to Bitrix24, retrying transient failures."""
+    if breaker.is_open:
+        logger.error("Bitrix24 circuit breaker is open. Dropping notification.")
+        return
+
+    try:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential_jitter(initial=0.2, max=2.0),
+            retry=retry_if_exception_type(httpx.TransportError),
+            reraise=True,
+        ):
+            with attempt:
+                response = await http.post(url, content=bitrix_message)
     except httpx.RequestError as exc:
+        breaker.record_failure()
         logger.error(
             f"An error occurred while sending the message to Bitrix24: {exc}"
         )
-        logger.info(f"Received webhook: {data}")
-
-    if response.status_code == 200:
-        return {"message": "Webhook received and forwarded to Bitrix24 successfully"}
-    else:
-        failed_message = f"Failed to send message to Bitrix24: {response.text}"
-        logger.error(failed_message)
-        return {"error": failed_message}
+        logger.opt(lazy=True).debug(
+            "Undelivered message: {}", lambda: bitrix_message
+        )
+        return
+
+    if response.status_code != 200:
+        breaker.record_failure()
+        logger.error(f"Failed to send message to Bitrix24: {response.text}")
+        return
+
+    if is_batch:
+        batch_errors = _batch_errors(response)
+        if batch_errors:
+            breaker.record_failure()
+            logger.error(
+                f"Bitrix24 batch reported command errors: {batch_errors}"
+            )
+            return
+    breaker.record_success()
+
+
+async def _worker(app: FastAPI) -> None:
+    """Drain the delivery queue and send queued messages to Bitrix24."""
+    queue: asyncio.Queue = app.state.queue
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < BATCH_MAX and not queue.empty():
+            batch.append(queue.get_nowait())
+        batch_url = get_settings().bitrix24_batch_url
+        try:
+            if batch_url and len(batch) > 1:
+                await _deliver(
+                    app.state.http,
+                    app.state.breaker,
+                    _build_batch_body(batch),
+                    url=batch_url,
+                    is_batch=True,
+                )
+            else:
+                for bitrix_message in batch:
+                    await _deliver(
+                        app.state.http, app.state.breaker, bitrix_message
+                    )
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+@app.post("/sentry-webhook")
+async def receive_sentry_webhook(request: Request, payload: SentryPayload):
+    """Process a Sentry webhook."""
+    if payload.id is not None and payload.id in _seen:
+        _seen.move_to_end(payload.id)
+        return {"message": "Duplicate webhook. Skipping notification."}
+
+    bitrix_message = transform_sentry_webhook_to_google_chat(payload)
+    if not bitrix_message:
+        return {"message": "Environment not allowed. Skipping notification."}
+
+    try:
+        request.app.state.queue.put_nowait(bitrix_message)
+    except asyncio.QueueFull:
+        logger.error("Delivery queue is full. Dropping notification.")
+        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    # Register the id only after a successful enqueue, so a redelivery
+    # after a 503 is not mistaken for a duplicate.
+    if payload.id is not None:
+        _seen[payload.id] = None
+        if len(_seen) > SEEN_MAXSIZE:
+            _seen.popitem(last=False)
+    return Response(status_code=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,35 @@
+"""Application settings, validated once from the environment."""
+
+from functools import lru_cache
+from typing import Annotated, FrozenSet, Optional
+
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Environment-backed configuration, parsed and frozen at startup."""
+
+    bitrix24_webhook_url: str
+    bitrix24_dialog_id: Optional[str] = None
+    bitrix24_batch_url: Optional[str] = None
+    sentry_dsn: str
+    allowed_environments: Annotated[FrozenSet[str], NoDecode] = frozenset(
+        {"production", "prod"}
+    )
+    log_level: str = "INFO"
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True)
+
+    @field_validator("allowed_environments", mode="before")
+    @classmethod
+    def _split_environments(cls, value):
+        if isinstance(value, str):
+            value = value.split(",")
+        return frozenset(environment.strip().lower() for environment in value)
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return the process-wide Settings instance, built on first use."""
+    return Settings()
@@ -1,11 +1,23 @@
+import orjson
 import pytest
 import pytest_asyncio
+from asgi_lifespan import LifespanManager
 from unittest.mock import patch, MagicMock, AsyncMock
 from httpx import AsyncClient, ASGITransport
 
 
 with patch("sentry_sdk.init") as mock_sentry_init:
-    from app.main import app, transform_sentry_webhook_to_google_chat
+    from app.main import (
+        CircuitBreaker,
+        SentryPayload,
+        _build_batch_body,
+        _deliver,
+        _seen,
+        app,
+        transform_sentry_webhook_to_google_chat,
+    )
+
+from app.settings import get_settings
 
 
 @pytest.fixture(autouse=True)
@@ -13,23 +25,31 @@ def mock_environment(monkeypatch):
     monkeypatch.setenv("BITRIX24_WEBHOOK_URL", "MOCK_URL")
     monkeypatch.setenv("SENTRY_DSN", "MOCK_SENTRY_DSN")
     monkeypatch.setenv("ALLOWED_ENVIRONMENTS", "production,prod")
+    # Settings are cached per process; rebuild them from this test's env
+    # and drop the test's values again on teardown.
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
 
 
-@pytest_asyncio.fixture
+@pytest_asyncio.fixture(scope="session")
 async def async_test_client():
-    async with AsyncClient(
-        transport=ASGITransport(app=app), base_url="http://test"
-    ) as client:
-        yield client
+    async with LifespanManager(app):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            yield client
 
 
 @pytest.fixture
 def mock_http_client():
-    with patch("httpx.AsyncClient") as mock:
-        mock_instance = AsyncMock()
-        mock_instance.post.return_value = MagicMock(status_code=200)
-        mock.return_value.__aenter__.return_value = mock_instance
-        yield mock_instance
+    mock_instance = AsyncMock()
+    mock_instance.post.return_value = MagicMock(status_code=200)
+    real_http = getattr(app.state, "http", None)
+    app.state.http = mock_instance
+    _seen.clear()
+    yield mock_instance
+    app.state.http = real_http
 
 
 VALID_PAYLOAD = {
@@ -48,8 +68,8 @@ class TestWebhookHandler:
     async def test_successful_processing(self, async_test_client, mock_http_client):
         response = await async_test_client.post("/sentry-webhook", json=VALID_PAYLOAD)
 
-        assert response.status_code == 200
-        assert "successfully" in response.json()["message"]
+        assert response.status_code == 202
+        await app.state.queue.join()
         mock_http_client.post.assert_called_once()
 
     async def test_non_production_environment(
@@ -61,21 +81,90 @@ class TestWebhookHandler:
 
         assert response.status_code == 200
         assert "Skipping notification" in response.json()["message"]
+        await app.state.queue.join()
         mock_http_client.post.assert_not_called()
 
+    async def test_duplicate_webhook(self, async_test_client, mock_http_client):
+        first = await async_test_client.post("/sentry-webhook", json=VALID_PAYLOAD)
+        second = await async_test_client.post("/sentry-webhook", json=VALID_PAYLOAD)
+
+        assert first.status_code == 202
+        assert "Duplicate" in second.json()["message"]
+        await app.state.queue.join()
+        mock_http_client.post.assert_called_once()
+
 
 class TestPayloadTransformation:
     def test_valid_transformation(self):
-        result = transform_sentry_webhook_to_google_chat(VALID_PAYLOAD)
-        assert isinstance(result, dict)
-        assert "*Level*: error" in result["text"]
-        assert "*URL*: http://test.com" in result["text"]
+        result = transform_sentry_webhook_to_google_chat(
+            SentryPayload(**VALID_PAYLOAD)
+        )
+        assert isinstance(result, bytes)
+        message = orjson.loads(result)["MESSAGE"]
+        assert "*Level*: error" in message
+        assert "*URL*: http://test.com" in message
+
+    def test_allowed_environments_override(self, monkeypatch):
+        monkeypatch.setenv("ALLOWED_ENVIRONMENTS", "staging")
+        get_settings.cache_clear()
+
+        result = transform_sentry_webhook_to_google_chat(
+            SentryPayload(**VALID_PAYLOAD)
+        )
+        assert result is None
 
     def test_invalid_payload(self):
         """
         Проверка обработки невалидного payload.
         """
-        assert transform_sentry_webhook_to_google_chat({}) is None
+        assert transform_sentry_webhook_to_google_chat(SentryPayload()) is None
+
+
+class TestBatchBody:
+    def test_wraps_messages_as_batch_commands(self):
+        messages = [
+            orjson.dumps({"DIALOG_ID": "chat1", "MESSAGE": "first"}),
+            orjson.dumps({"DIALOG_ID": "chat1", "MESSAGE": "second"}),
+        ]
+        body = orjson.loads(_build_batch_body(messages))
+        assert body["cmd"]["n0"] == "im.message.add?DIALOG_ID=chat1&MESSAGE=first"
+        assert body["cmd"]["n1"] == "im.message.add?DIALOG_ID=chat1&MESSAGE=second"
+
+    @pytest.mark.asyncio
+    async def test_batch_command_errors_count_as_failures(self):
+        http = AsyncMock()
+        http.post.return_value = MagicMock(
+            status_code=200,
+            content=orjson.dumps(
+                {"result": {"result_error": {"n0": "Dialog not found"}}}
+            ),
+        )
+        breaker = CircuitBreaker(fail_max=1, reset_timeout=30.0)
+
+        await _deliver(http, breaker, b"{}", url="MOCK_BATCH_URL", is_batch=True)
+
+        assert breaker.is_open
+
+
+class TestCircuitBreaker:
+    def test_opens_after_max_failures(self):
+        breaker = CircuitBreaker(fail_max=2, reset_timeout=30.0)
+        breaker.record_failure()
+        assert not breaker.is_open
+        breaker.record_failure()
+        assert breaker.is_open
+
+    def test_closes_after_reset_timeout(self):
+        breaker = CircuitBreaker(fail_max=1, reset_timeout=0.0)
+        breaker.record_failure()
+        assert not breaker.is_open
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(fail_max=2, reset_timeout=30.0)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert not breaker.is_open
 
 
 @pytest.mark.asyncio